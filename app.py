@@ -1,8 +1,9 @@
 # app.py (Version 3 - With Conversational Chatbot)
 
+import os
 import streamlit as st
 import pandas as pd
-import json
+import orjson
 import plotly.express as px
 import openai
 
@@ -14,18 +15,180 @@ st.set_page_config(
 )
 
 # --- LOAD ANALYZED DATA ---
-@st.cache_data
-def load_data():
+DATA_FILE = 'analyzed_data.json'
+
+# Persisted to disk so a server restart doesn't have to re-parse the JSON. `data_mtime` is only there
+# to make the cache key change (and the data reload) whenever the file is rewritten.
+@st.cache_data(persist="disk", show_spinner=False)
+def load_data(data_mtime):
     try:
-        with open('analyzed_data.json', 'r') as f:
-            data = json.load(f)
-        df = pd.json_normalize(data, sep='_')
+        with open(DATA_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
+        # Only `analysis` is nested, so flatten it by hand (much faster than pd.json_normalize)
+        rows = []
+        for record in data:
+            flat = {k: v for k, v in record.items() if k != "analysis"}
+            flat.update({f"analysis_{k}": v for k, v in record.get("analysis", {}).items()})
+            rows.append(flat)
+        df = pd.DataFrame(rows)
+        # Low-cardinality text columns are stored as categories: less memory, faster groupby / value_counts
+        for col in ['department', 'designation', 'analysis_overallSentiment', 'exitReason']:
+            df[col] = df[col].astype('category')
+        # Indexed by display name so picking an interview in tab 2 is a direct lookup, not a scan over the DataFrame
+        df.index = df['employeeName'] + " (" + df['employeeID'] + ")"
+        df.index.name = 'display_name'
         return df
     except FileNotFoundError:
         st.error("`analyzed_data.json` not found. Please run the `pre_analyze.py` script first.", icon="🚨")
         return None
 
-df = load_data()
+# --- DASHBOARD AGGREGATES ---
+# Cached so the pandas work behind the dashboard only happens once, not on every widget interaction.
+# Keyed on `data_mtime` like load_data; the leading underscore tells Streamlit not to hash `_df` itself.
+@st.cache_data
+def compute_aggregates(data_mtime, _df):
+    df = _df
+    return {
+        "theme_counts": df['analysis_keyThemes'].explode().value_counts(),
+        # A single crosstab pass instead of groupby + value_counts + unstack + fillna
+        "sentiment_by_dept": pd.crosstab(df['department'], df['analysis_overallSentiment']),
+        "neg_count": int((df['analysis_overallSentiment'] == 'Negative').sum()),
+    }
+
+# --- CHATBOT SYSTEM PROMPT ---
+# The "Brain" of the Chatbot. Cached so the data isn't re-serialized on every rerun / chat message.
+# Only the fields the assistant needs; transcripts and extracted entities are left out to keep the prompt small.
+PROMPT_COLUMNS = [
+    'employeeID', 'employeeName', 'department', 'designation', 'exitReason',
+    'analysis_overallSentiment', 'analysis_keyThemes', 'analysis_summary'
+]
+
+# Keyed on `data_mtime` like compute_aggregates, so Streamlit doesn't have to hash (pickle) the DataFrame.
+@st.cache_data
+def build_system_prompt(data_mtime, _df):
+    df = _df
+    # Instead of sending every interview (transcripts and all), we send pre-computed statistics plus a
+    # compact per-employee index. The model can pull a full interview on demand with the get_interview tool.
+    themes = df[['department', 'analysis_keyThemes']].explode('analysis_keyThemes')
+    aggregates = {
+        "totalInterviews": len(df),
+        "interviewsByDepartment": df['department'].value_counts().to_dict(),
+        "sentimentDistribution": df['analysis_overallSentiment'].value_counts().to_dict(),
+        "sentimentByDepartment": {
+            dept: counts.value_counts().loc[lambda c: c > 0].to_dict()
+            for dept, counts in df.groupby('department', observed=True)['analysis_overallSentiment']
+        },
+        "themeCounts": themes['analysis_keyThemes'].value_counts().to_dict(),
+        "themeCountsByDepartment": {
+            dept: counts.value_counts().to_dict()
+            for dept, counts in themes.groupby('department', observed=True)['analysis_keyThemes']
+        },
+    }
+    # Compact (un-indented) JSON: whitespace costs tokens too
+    data_as_json = orjson.dumps(
+        {"aggregates": aggregates, "interviews": df[PROMPT_COLUMNS].to_dict(orient='records')},
+        option=orjson.OPT_SERIALIZE_NUMPY
+    ).decode()
+
+    return f"""
+    You are a quantitative HR Analyst AI assistant for an HR leader at Optum.
+    Your primary goal is to provide data-driven, statistical insights from the provided exit interview data.
+    You must answer questions based ONLY on the provided JSON data below. Do not make up information.
+    The data contains pre-computed aggregate statistics and a short index of every interview. If you need the
+    full details of a specific interview (e.g. the transcript), call the `get_interview` tool with its employeeID.
+
+    **RESPONSE GUIDELINES:**
+    1.  **Quantify First:** Always lead with statistics. Use counts, percentages, or fractions (e.g., "The top reason is 'Career Growth', mentioned in 4 out of 8 Engineering departures (50%).").
+    2.  **Synthesize, Don't Just List:** Do not list individual summaries one-by-one. Instead, synthesize trends and use individual cases as brief, supporting examples.
+    3.  **Structure Your Answers:** Provide a clear headline finding, followed by quantitative evidence, and then a brief qualitative example if relevant.
+    4.  **Be Direct and Actionable:** Frame your answers to help the HR leader make decisions.
+
+    Here is the exit interview data:
+```json
+    {data_as_json}
+    ```
+    """
+
+# --- CHATBOT TOOLS ---
+CHAT_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_interview",
+            "description": "Get the full record of a single exit interview, including the transcript and extracted entities.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "employee_id": {"type": "string", "description": "The employeeID of the interview, e.g. E001."}
+                },
+                "required": ["employee_id"]
+            }
+        }
+    }
+]
+
+# How many rounds of get_interview calls the model gets per chat turn before it must answer
+MAX_TOOL_ROUNDS = 3
+
+def get_interview(df, employee_id):
+    match = df[df['employeeID'] == employee_id]
+    if match.empty:
+        return orjson.dumps({"error": f"No interview found for employeeID '{employee_id}'."}).decode()
+    return orjson.dumps(match.iloc[0].to_dict(), option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+def stream_chat_response(df, messages):
+    """
+    Streams the assistant's reply, answering any get_interview tool calls the model makes along the way.
+    """
+    messages = list(messages)
+    for tool_round in range(MAX_TOOL_ROUNDS + 1):
+        stream = openai.chat.completions.create(
+            model="gpt-4-turbo", # GPT-4 is better at reasoning over structured data
+            messages=messages,
+            tools=CHAT_TOOLS,
+            # Once the tool budget is used up, the model has to answer with what it already has
+            tool_choice="auto" if tool_round < MAX_TOOL_ROUNDS else "none",
+            stream=True,
+        )
+        # Tool calls arrive in pieces, so stitch them back together as we go
+        content = []
+        tool_calls = {}
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                yield delta.content
+            for call in delta.tool_calls or []:
+                entry = tool_calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+                if call.id:
+                    entry["id"] = call.id
+                if call.function and call.function.name:
+                    entry["name"] += call.function.name
+                if call.function and call.function.arguments:
+                    entry["arguments"] += call.function.arguments
+
+        if not tool_calls:
+            return
+
+        messages.append({
+            "role": "assistant",
+            "content": "".join(content) or None,
+            "tool_calls": [
+                {"id": c["id"], "type": "function", "function": {"name": c["name"], "arguments": c["arguments"]}}
+                for c in tool_calls.values()
+            ]
+        })
+        for c in tool_calls.values():
+            try:
+                employee_id = orjson.loads(c["arguments"] or "{}").get("employee_id", "")
+            except orjson.JSONDecodeError:
+                employee_id = ""
+            messages.append({"role": "tool", "tool_call_id": c["id"], "content": get_interview(df, employee_id)})
+
+data_mtime = os.path.getmtime(DATA_FILE) if os.path.exists(DATA_FILE) else None
+df = load_data(data_mtime)
 
 # Initialize OpenAI client from secrets
 openai.api_key = st.secrets["OPENAI_API_KEY"]
@@ -42,17 +205,18 @@ tab1, tab2, tab3 = st.tabs(["📊 Aggregate Dashboard", "🧑‍💼 Individual
 # --- TAB 1: AGGREGATE DASHBOARD ---
 with tab1:
     st.header("Overall Exit Trends")
+    aggregates = compute_aggregates(data_mtime, df)
 
     # --- KPIs ---
     col1, col2, col3 = st.columns(3)
     with col1:
         st.metric("Total Interviews Analyzed", len(df))
     with col2:
-        neg_sentiment_count = df[df['analysis_overallSentiment'] == 'Negative'].shape[0]
+        neg_sentiment_count = aggregates["neg_count"]
         neg_sentiment_perc = (neg_sentiment_count / len(df)) * 100
         st.metric("Negative Sentiment Rate", f"{neg_sentiment_perc:.1f}%")
     with col3:
-        top_theme = df['analysis_keyThemes'].explode().value_counts().idxmax()
+        top_theme = aggregates["theme_counts"].idxmax()
         st.metric("Top Reason for Leaving", top_theme)
 
     st.markdown("---")
@@ -61,7 +225,7 @@ with tab1:
     col1_charts, col2_charts = st.columns(2)
     with col1_charts:
         st.subheader("Top Reasons for Leaving")
-        themes_df = df['analysis_keyThemes'].explode().value_counts().reset_index()
+        themes_df = aggregates["theme_counts"].reset_index()
         themes_df.columns = ['Theme', 'Count']
         # --- CHANGE HERE: Removed orientation='h', swapped x and y ---
         fig_themes = px.bar(themes_df, x='Theme', y='Count', title="Frequency of Key Themes")
@@ -69,7 +233,7 @@ with tab1:
         
     with col2_charts:
         st.subheader("Sentiment by Department")
-        sentiment_by_dept = df.groupby('department')['analysis_overallSentiment'].value_counts().unstack().fillna(0)
+        sentiment_by_dept = aggregates["sentiment_by_dept"]
 
         sentiment_color_map = {
             'Negative': '#E74C3C',  # A clear red
@@ -78,6 +242,7 @@ with tab1:
             'Neutral': '#BDC3C7'   # A neutral grey
         }
 
+        # Pass the color map to the plotting function
         fig_sentiment_dept = px.bar(
             sentiment_by_dept,
             barmode='stack', # <-- CHANGED TO 'stack'
@@ -86,27 +251,16 @@ with tab1:
         )
         st.plotly_chart(fig_sentiment_dept, use_container_width=True)
 
-        # Pass the color map to the plotting function
-        fig_sentiment_dept = px.bar(
-            sentiment_by_dept,
-            barmode='group',
-            title="Sentiment Distribution Across Departments",
-            color_discrete_map=sentiment_color_map # <-- This is the magic line!
-        )
-        
-        st.plotly_chart(fig_sentiment_dept, use_container_width=True)
-
 # --- TAB 2: INDIVIDUAL ANALYSIS ---
 with tab2:
     st.header("Drill Down into Individual Interviews")
     
-    df['display_name'] = df['employeeName'] + " (" + df['employeeID'] + ")"
     selected_interview_display = st.selectbox(
         label="Choose an interview to analyze:",
-        options=df['display_name']
+        options=df.index
     )
 
-    selected_interview = df[df['display_name'] == selected_interview_display].iloc[0]
+    selected_interview = df.loc[selected_interview_display]
 
     col1_ind, col2_ind = st.columns(2)
     with col1_ind:
@@ -147,31 +301,11 @@ with tab3:
     st.header("Ask the AI Assistant")
     st.markdown("Ask questions about the exit interview data in plain English. The AI will answer based on the analyzed results.")
 
-    # --- The System Prompt: The "Brain" of the Chatbot ---
-    # We convert our DataFrame of analyzed data into a JSON string to pass to the model
-    data_as_json = df.to_json(orient='records', indent=2)
-
-    SYSTEM_PROMPT = f"""
-    You are a quantitative HR Analyst AI assistant for an HR leader at Optum.
-    Your primary goal is to provide data-driven, statistical insights from the provided exit interview data.
-    You must answer questions based ONLY on the provided JSON data below. Do not make up information.
-
-    **RESPONSE GUIDELINES:**
-    1.  **Quantify First:** Always lead with statistics. Use counts, percentages, or fractions (e.g., "The top reason is 'Career Growth', mentioned in 4 out of 8 Engineering departures (50%).").
-    2.  **Synthesize, Don't Just List:** Do not list individual summaries one-by-one. Instead, synthesize trends and use individual cases as brief, supporting examples.
-    3.  **Structure Your Answers:** Provide a clear headline finding, followed by quantitative evidence, and then a brief qualitative example if relevant.
-    4.  **Be Direct and Actionable:** Frame your answers to help the HR leader make decisions.
-
-    Here is the exit interview data:
-```json
-    {data_as_json}
-    ```
-    """
-
     # --- Initialize Chat History ---
+    # The system prompt is only needed once per session, so only build it here
     if "messages" not in st.session_state:
         st.session_state.messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": build_system_prompt(data_mtime, df)},
             {"role": "assistant", "content": "Hello! How can I help you analyze the exit interview data today?"}
         ]
 
@@ -188,15 +322,10 @@ with tab3:
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Get AI response
+        # Get AI response, streaming tokens to the screen as they arrive
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = openai.chat.completions.create(
-                    model="gpt-4-turbo", # GPT-4 is better at reasoning over structured data
-                    messages=[{"role": m["role"], "content": m["content"]} for m in st.session_state.messages],
-                )
-                response_content = response.choices[0].message.content
-                st.markdown(response_content)
+            # The stored messages are already plain {"role", "content"} dicts, so they can be sent as-is
+            response_content = st.write_stream(stream_chat_response(df, st.session_state.messages))
         
         # Add AI response to session state
         st.session_state.messages.append({"role": "assistant", "content": response_content})
@@ -2,7 +2,11 @@
 
 import openai
 import json
-from tqdm import tqdm # A library to show a cool progress bar!
+import orjson
+import asyncio
+import hashlib
+import pathlib
+from tqdm.asyncio import tqdm # A library to show a cool progress bar!
 import os
 
 # --- SETUP ---
@@ -11,15 +15,31 @@ import os
 # Or, for simplicity in this demo, just paste it here (but don't share the file!).
 # A better way is to load it from the .streamlit/secrets.toml file if you can.
 
-openai.api_key = st.secrets["OPENAI_API_KEY"]
+# How many requests we keep in flight at once. Tune this to your account's rate limit (RPM).
+MAX_CONCURRENT_REQUESTS = 20
+# How many times the OpenAI client retries rate limits (429), server errors (5xx) and connection errors.
+# The client backs off exponentially between attempts on its own.
+MAX_RETRIES = 5
+
+client = openai.AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=MAX_RETRIES)
+
+MODEL = "gpt-4-turbo-preview"
+# Below this many interviews we skip the Batch API and just call the model directly
+BATCH_API_MIN_INTERVIEWS = 20
+# How often (in seconds) we check whether a submitted batch has finished
+BATCH_POLL_INTERVAL = 30
+
+# Analyses are cached on disk by model + transcript, so re-running the script doesn't pay for them twice
+CACHE_DIR = pathlib.Path(".llm_cache")
+CACHE_DIR.mkdir(exist_ok=True)
 
 
 # --- AI ANALYSIS FUNCTION (Copied from app.py) ---
-def analyze_interview(transcript_text):
+def build_prompt(transcript_text):
     """
-    Analyzes a single interview transcript using OpenAI's API.
+    Builds the analysis prompt for a single interview transcript.
     """
-    prompt = f"""
+    return f"""
     You are an expert HR analyst AI. Your task is to analyze an exit interview transcript and extract key insights.
     Analyze the following interview transcript and provide your output in a structured JSON format.
 
@@ -43,41 +63,175 @@ def analyze_interview(transcript_text):
     ```
     CRITICAL: Only output the final JSON object. Do not include any other text or explanations.
     """
+
+def cache_path(transcript_text):
+    key = hashlib.sha256((MODEL + transcript_text).encode("utf-8")).hexdigest()
+    return CACHE_DIR / f"{key}.json"
+
+def load_cached_analysis(transcript_text):
+    path = cache_path(transcript_text)
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4-turbo-preview",
+        return orjson.loads(path.read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        # A missing or corrupt cache file just means we analyze that interview again
+        return None
+
+def save_cached_analysis(transcript_text, result):
+    # Write to a temp file and swap it in, so a crash mid-write can't leave a half-written cache file
+    path = cache_path(transcript_text)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(orjson.dumps(result))
+    os.replace(tmp_path, path)
+
+async def analyze_interview(transcript_text):
+    """
+    Analyzes a single interview transcript using OpenAI's API.
+    """
+    prompt = build_prompt(transcript_text)
+    try:
+        response = await client.chat.completions.create(
+            model=MODEL,
             messages=[{"role": "user", "content": prompt}],
             response_format={"type": "json_object"}
         )
-        return json.loads(response.choices[0].message.content)
+        result = json.loads(response.choices[0].message.content)
+        save_cached_analysis(transcript_text, result)
+        return result
     except Exception as e:
         print(f"An error occurred during analysis: {e}")
         return None
 
+async def analyze_with_live_requests(interviews):
+    """
+    Analyzes interviews with concurrent chat completion calls. Returns one result (or None) per interview.
+    """
+    # All interviews are sent at once, but the semaphore caps how many are in flight
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    tasks = [bounded(analyze_interview(i["interviewTranscript"])) for i in interviews]
+
+    # Use tqdm to create a nice progress bar in the terminal
+    return await tqdm.gather(*tasks, desc="Analyzing Interviews")
+
+def read_jsonl(text):
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def batch_record_error(record):
+    """
+    Returns the error for a single Batch API result line, or None if the request succeeded.
+    """
+    if record.get("error"):
+        return record["error"]
+    response = record.get("response")
+    if response is None:
+        return "No response returned."
+    if response.get("status_code") != 200:
+        return (response.get("body") or {}).get("error", f"HTTP {response.get('status_code')}")
+    return None
+
+async def analyze_with_batch_api(interviews):
+    """
+    Analyzes interviews through OpenAI's Batch API (cheaper, but can take up to 24h).
+    Returns one result (or None) per interview.
+    """
+    # One JSONL line per interview; custom_id lets us match the results back up afterwards
+    lines = []
+    for interview in interviews:
+        lines.append(json.dumps({
+            "custom_id": interview["employeeID"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": MODEL,
+                "messages": [{"role": "user", "content": build_prompt(interview["interviewTranscript"])}],
+                "response_format": {"type": "json_object"}
+            }
+        }))
+    batch_input = ("\n".join(lines) + "\n").encode("utf-8")
+
+    input_file = await client.files.create(file=("batch.jsonl", batch_input), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id}. Waiting for it to finish...")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status == "failed":
+        print(f"Batch {batch.id} finished with status '{batch.status}'.")
+        return [None] * len(interviews)
+    if batch.status != "completed":
+        # Expired / cancelled batches still write (and bill) the requests that did finish, so keep those
+        print(f"Batch {batch.id} finished with status '{batch.status}'. Saving the requests that completed.")
+
+    transcripts_by_id = {i["employeeID"]: i["interviewTranscript"] for i in interviews}
+    results_by_id = {}
+
+    # Successful requests (and some failed ones) land in the output file...
+    if batch.output_file_id:
+        output = await client.files.content(batch.output_file_id)
+        for record in read_jsonl(output.text):
+            error = batch_record_error(record)
+            if error:
+                print(f"An error occurred during analysis of {record.get('custom_id')}: {error}")
+                continue
+            try:
+                content = record["response"]["body"]["choices"][0]["message"]["content"]
+                results_by_id[record["custom_id"]] = json.loads(content)
+                save_cached_analysis(transcripts_by_id[record["custom_id"]], results_by_id[record["custom_id"]])
+            except Exception as e:
+                print(f"An error occurred during analysis of {record.get('custom_id')}: {e}")
+
+    # ...the rest only show up in the error file
+    if batch.error_file_id:
+        errors = await client.files.content(batch.error_file_id)
+        for record in read_jsonl(errors.text):
+            print(f"An error occurred during analysis of {record.get('custom_id')}: {batch_record_error(record)}")
+
+    return [results_by_id.get(interview["employeeID"]) for interview in interviews]
+
 # --- MAIN SCRIPT LOGIC ---
-def main():
+async def main():
     print("Loading original interview data...")
-    with open('data.json', 'r') as f:
-        interviews_data = json.load(f)
+    with open('data.json', 'rb') as f:
+        interviews_data = orjson.loads(f.read())
 
     analyzed_interviews = []
-    print(f"Starting analysis of {len(interviews_data)} interviews...")
+    interviews = [i for i in interviews_data if i.get("interviewTranscript", "")]
+    print(f"Starting analysis of {len(interviews)} interviews...")
 
-    # Use tqdm to create a nice progress bar in the terminal
-    for interview in tqdm(interviews_data, desc="Analyzing Interviews"):
-        transcript = interview.get("interviewTranscript", "")
-        if transcript:
-            analysis_result = analyze_interview(transcript)
-            if analysis_result:
-                # Combine original data with the new analysis
-                combined_data = {**interview, "analysis": analysis_result}
-                analyzed_interviews.append(combined_data)
+    # Interviews we've already analyzed come straight from the cache; only the rest go to the API
+    results = [load_cached_analysis(i["interviewTranscript"]) for i in interviews]
+    pending = [n for n, result in enumerate(results) if result is None]
+    print(f"{len(interviews) - len(pending)} found in cache, {len(pending)} to analyze.")
+
+    # The Batch API is half the price but slow to turn around, so only use it for larger runs
+    if len(pending) >= BATCH_API_MIN_INTERVIEWS:
+        new_results = await analyze_with_batch_api([interviews[n] for n in pending])
+    else:
+        new_results = await analyze_with_live_requests([interviews[n] for n in pending])
+    for n, result in zip(pending, new_results):
+        results[n] = result
+
+    for interview, analysis_result in zip(interviews, results):
+        if analysis_result:
+            # Combine original data with the new analysis
+            combined_data = {**interview, "analysis": analysis_result}
+            analyzed_interviews.append(combined_data)
 
     print("Analysis complete. Saving results to analyzed_data.json...")
-    with open('analyzed_data.json', 'w') as f:
-        json.dump(analyzed_interviews, f, indent=2)
+    with open('analyzed_data.json', 'wb') as f:
+        f.write(orjson.dumps(analyzed_interviews, option=orjson.OPT_INDENT_2))
     
     print("Done! You can now run the Streamlit app.")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())